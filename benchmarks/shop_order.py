@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+""" Compares searches over shops and products stored in CSV order
+and in Hilbert curve order.
+
+For each order and search radius it reports the mean time of the k-d tree
+query and of looking up the shops found and merging their products,
+the fastest of `repeat` runs, and the mean number of contiguous index runs
+in the result.
+Fewer runs means the indices of a search are closer together.
+
+There is no products dataset, so each shop gets random products.
+
+    $ python benchmarks/shop_order.py
+
+"""
+
+import os
+import sys
+import timeit
+from random import choice, randint, random, seed
+
+import pandas as pd
+
+root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.abspath(root))
+
+from server.product import Product, PopularProductsService
+from server.shop import Shop, ShopRepository, spatial_order
+
+# Search radiuses in km.
+distances = [0.2, 0.5, 1]
+# Number of products to return per search.
+count = 100
+# Number of searches per order and radius.
+search_count = 200
+# Number of times the searches are repeated. The fastest time is reported.
+repeat = 7
+
+
+def load_shops():
+    path = os.path.join(root, 'data', 'shops.csv')
+    return [Shop(r[0], (r[2], r[3]), r[1]) for r in pd.read_csv(path).get_values()]
+
+
+def gen_products(shops):
+    return [Product(len(shops) * i + j, shop.id, 'title', random(), randint(0, 100))
+            for j, shop in enumerate(shops) for i in range(randint(0, 20))]
+
+
+def count_runs(indices):
+    """ Counts the runs of consecutive indices.
+
+    """
+    return sum(1 for a, b in zip([None] + indices, indices) if a is None or b != a + 1)
+
+
+def mean_ms(f, items):
+    elapsed = timeit.repeat(lambda: [f(item) for item in items], number=1, repeat=repeat)
+    return min(elapsed) * 1000 / len(items)
+
+
+def bench(name, shops, products, centers, distance):
+    repo = ShopRepository(shops)
+    service = PopularProductsService(products, [s.id for s in shops])
+
+    # The same radius as the range search of `ShopRepository.find_shops`.
+    query = lambda c: sorted(repo._loc_index.query_ball_point(c, repo._to_degrees(c, distance)))
+    results = [query(c) for c in centers]
+
+    merge = lambda loc_idx: service.find_popular_products(
+        [repo._shops[i].id for i in loc_idx], count)
+
+    runs = float(sum(count_runs(loc_idx) for loc_idx in results)) / len(results)
+    shops_found = float(sum(len(loc_idx) for loc_idx in results)) / len(results)
+
+    print("{0:>8} {1:>4} km: {2:7.3f} ms query, {3:7.3f} ms merge, "
+          "{4:7.1f} shops, {5:7.1f} runs".format(
+              name, distance, mean_ms(query, centers), mean_ms(merge, results),
+              shops_found, runs))
+
+
+def main():
+    seed(0)
+    shops = load_shops()
+    products = gen_products(shops)
+    centers = [choice(shops).location for i in range(search_count)]
+
+    for distance in distances:
+        bench('csv', shops, products, centers, distance)
+        bench('hilbert', spatial_order(shops), products, centers, distance)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
-from flask import Blueprint, current_app, jsonify, request
+from math import isinf, isnan
+from flask import Blueprint, abort, current_app, jsonify, request
+from server.deadline import Deadline
 
 api = Blueprint('api', __name__)
 
@@ -17,21 +19,99 @@ def search():
     distance = request.args.get('d', 10, float)
     tags = request.args.get('tags', None, str)
     count = request.args.get('n', 100, int)
+    polygon = request.args.get('polygon', None)
+    route = request.args.get('route', None)
+    timeout = current_app.config['SEARCH_DEADLINE']
 
     if bool(tags):
         tags = tags.split(',')
 
-    shops = current_app.shop_repo.find_shops((lat, lon), distance, tags)
-    products = current_app.prod_service.find_popular_products([s.id for s in shops], count)
+    # Only one search shape can be given:
+    # a circle by `lat`, `lon` and `d`, a polygon, or a route with `d`.
+    circle = set(['lat', 'lon', 'd']) & set(request.args.keys())
+    if polygon is not None and (route is not None or circle):
+        abort(400)
+    if route is not None and circle - set(['d']):
+        abort(400)
+
+    # A polygon needs at least 3 vertices, a route at least 1 point.
+    try:
+        if polygon is not None:
+            polygon = parse_path(polygon, 3)
+        if route is not None:
+            route = parse_path(route, 1)
+    except ValueError:
+        abort(400)
+
+    # A request can only shorten the server's deadline.
+    if 'deadline' in request.args:
+        try:
+            timeout = parse_deadline(request.args['deadline'], timeout)
+        except ValueError:
+            abort(400)
+
+    # The deadline is given in milliseconds.
+    deadline = Deadline(timeout / 1000.0 if timeout else None)
+
+    # The range search gets half of the budget,
+    # so there is time left to merge the products of the shops found.
+    range_deadline = deadline.share(0.5)
+
+    repo = current_app.shop_repo
+    if polygon is not None:
+        shops = repo.find_shops_in_polygon(polygon, tags, range_deadline)
+    elif route is not None:
+        shops = repo.find_shops_along_route(route, distance, tags, range_deadline)
+    else:
+        shops = repo.find_shops((lat, lon), distance, tags, range_deadline)
+
+    products = current_app.prod_service.find_popular_products(
+        [s.id for s in shops], count, deadline)
 
     d = current_app.shops_by_id
     resp = jsonify({
-        'products': [serialize(p, d) for p in products]
+        'products': [serialize(p, d) for p in products],
+        'partial': deadline.exceeded
     })
     resp.headers['Access-Control-Allow-Origin'] = '*'
     return resp
 
 
+def parse_deadline(value, limit):
+    """ Parses the deadline of a search, in milliseconds.
+    The deadline is capped at `limit`, unless `limit` is 0,
+    which means the server has no deadline.
+
+    Raises a `ValueError` if the deadline is not a positive, finite number.
+
+    """
+    timeout = float(value)
+    if isnan(timeout) or isinf(timeout) or timeout <= 0:
+        raise ValueError("Invalid deadline: %s" % value)
+    return min(timeout, limit) if limit else timeout
+
+
+def parse_path(value, min_count=1):
+    """ Parses a list of GPS locations,
+    formatted as `lat,lon;lat,lon;...`.
+
+    Raises a `ValueError` if a location is not made of exactly 2 finite numbers,
+    within [-90, 90] for latitude and [-180, 180] for longitude,
+    or if there are less than `min_count` locations.
+
+    """
+    path = []
+    for loc in value.split(';'):
+        coords = tuple(float(c) for c in loc.split(','))
+        if len(coords) != 2 or not (-90 <= coords[0] <= 90 and -180 <= coords[1] <= 180):
+            raise ValueError("Invalid location: %s" % loc)
+        path.append(coords)
+
+    if len(path) < min_count:
+        raise ValueError("Expected at least %d locations" % min_count)
+    return path
+
+
 def serialize(p, shops):
     s = shops[p.shop_id]
     return {
@@ -5,7 +5,7 @@ import pandas as pd
 from flask import Flask
 from server.api import api
 from server.product import Product, PopularProductsService
-from server.shop import Shop, ShopRepository
+from server.shop import Shop, ShopRepository, spatial_order
 
 
 def create_app(settings_overrides=None):
@@ -22,7 +22,13 @@ def configure_settings(app, settings_override):
     app.config.update({
         'DEBUG': True,
         'TESTING': False,
-        'DATA_PATH': data_path
+        'DATA_PATH': data_path,
+        # Default latency budget of a search, in milliseconds.
+        # A value of 0 disables the deadline.
+        'SEARCH_DEADLINE': 200,
+        # Whether shops are indexed along a Hilbert curve instead of in CSV order.
+        # See `benchmarks/shop_order.py`.
+        'SPATIAL_ORDER': False
     })
     if settings_override:
         app.config.update(settings_override)
@@ -40,6 +46,11 @@ def initialize(app):
     taggings = [(tags[r[2]], r[1]) for r in get_data('taggings.csv')]
     products = [Product(r[0], r[1], r[2], r[3], r[4]) for r in get_data('products.csv')]
 
+    # Index the shops along a space-filling curve,
+    # and the references to their products in the same order.
+    if app.config['SPATIAL_ORDER']:
+        shops = spatial_order(shops)
+
     app.shop_repo = ShopRepository(shops, taggings)
-    app.prod_service = PopularProductsService(products)
+    app.prod_service = PopularProductsService(products, [s.id for s in shops])
     app.shops_by_id = {s.id: s for s in shops}
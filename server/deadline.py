@@ -0,0 +1,69 @@
+from time import time
+
+
+class Deadline(object):
+
+    def __init__(self, timeout=None, clock=time):
+        """ A latency budget for a single search request.
+        The search stages poll it and stop early once it expires,
+        returning the best result found so far.
+
+        Parameters
+        ----------
+        timeout : float
+            The budget in seconds. If None, the deadline never expires.
+        clock : callable
+            Returns the current time in seconds.
+
+        """
+        # The clock used to check the remaining time.
+        self._clock = clock
+
+        # The point in time after which the deadline is expired.
+        self._expires_at = None if timeout is None else clock() + timeout
+
+        # Whether the deadline is expired.
+        self._expired = False
+
+        # Whether a search stage was cut short by the deadline.
+        self.exceeded = False
+
+        # The deadline this one is a share of.
+        self._parent = None
+
+    def share(self, fraction):
+        """ Creates a deadline for a single stage of the search.
+        It expires after `fraction` of the remaining time,
+        leaving the rest of the budget to the following stages.
+        If it expires, this deadline is marked as exceeded too.
+
+        Parameters
+        ----------
+        fraction : float
+            The fraction of the remaining time given to the stage.
+
+        """
+        timeout = None
+        if self._expires_at is not None:
+            timeout = max(self._expires_at - self._clock(), 0) * fraction
+
+        stage = Deadline(timeout, self._clock)
+        stage._parent = self
+        return stage
+
+    def expired(self):
+        """ Checks if the deadline is expired.
+        Once expired, the deadline and the ones it is a share of
+        are marked as exceeded, signalling that the result is partial.
+
+        """
+        if not self._expired and self._expires_at is not None \
+                and self._clock() >= self._expires_at:
+            self._expired = True
+
+            deadline = self
+            while deadline is not None:
+                deadline.exceeded = True
+                deadline = deadline._parent
+
+        return self._expired
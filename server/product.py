@@ -1,53 +1,47 @@
-from rbtree import rbtree
+from server.deadline import Deadline
 
 
 class PopularProductsService(object):
     
-    def __init__(self, products):
+    def __init__(self, products, shop_ids=None):
         """ A service that finds the most popular products
         within a list of shops.
         
         Parameters
         ----------
         products : list of Products
+        shop_ids : list of strings
+            The order in which the shops' products are stored.
+            The products of shops not listed follow, in order of appearance.
         
         """
-        # Mapping from shop id to list of products within the shop.
-        # The products are sorted by popularity in descending order.
-        self._products_by_shop = {}
+        # A list of references to all products, where the products of each shop
+        # form a slice, in the order of `shop_ids`.
+        # The products of each shop are sorted by popularity in descending order.
+        self._products = []
+
+        # Mapping from shop id to the start and end
+        # of the shop's products within `_products`.
+        self._offsets = {}
         
         # Filter the out of stock products.
         products = filter(lambda p: p.quantity > 0, products)
 
+        # Group the products by shop.
+        products_by_shop = {}
         for p in products:
-            products = self._get_products_by_shop(p.shop_id)
-            products[p.popularity] = p
-    
-    def _get_products_by_shop(self, shop_id):
-        """ Returns a list of products for the `shop id`, ordered by popularity.
-        
-        Parameters
-        ----------
-        shop_id : string
-            The id of the shop for which to get the products.
+            products_by_shop.setdefault(p.shop_id, []).append(p)
 
-        Returns
-        -------
-        products : rbtree of Products
-            A red-black tree of Products, ordered by Product.popularity, in descending order.
-
-        """
-        
-        # Check if a mapping for the shop is missing.
-        if shop_id not in self._products_by_shop:
-            # Map the shop to an empty rbtree.
-            self._products_by_shop[shop_id] = rbtree(
-                cmp=PopularProductsService._duplicate_reverse_order_comparer)
-        
-        # Return the products for the shop.
-        return self._products_by_shop[shop_id]
+        # Store the products of each shop as a slice of the list.
+        for shop_id in list(shop_ids or []) + [p.shop_id for p in products]:
+            if shop_id in self._offsets or shop_id not in products_by_shop:
+                continue
+            start = len(self._products)
+            self._products.extend(
+                sorted(products_by_shop[shop_id], key=lambda p: p.popularity, reverse=True))
+            self._offsets[shop_id] = (start, len(self._products))
     
-    def find_popular_products(self, shop_ids, count):
+    def find_popular_products(self, shop_ids, count, deadline=None):
         """ Finds the most popular products within the specified shops.
         
         Parameters
@@ -56,6 +50,9 @@ class PopularProductsService(object):
             Ids of the shops included in the search.
         count : int
             The max number of products to return.
+        deadline : Deadline
+            The latency budget of the search.
+            If it expires, only the products merged so far are returned.
         
         Returns
         -------
@@ -63,35 +60,35 @@ class PopularProductsService(object):
             The list of most popular products.
         
         """
-        # Get the list of sorted products by popularity for each shop specified.
-        products_per_shop = [self._get_products_by_shop(id).values() for id in shop_ids]
-        
-        # Get an iterator for each list of products.
-        iterators = [iter(products) for products in products_per_shop]
+        if deadline is None:
+            deadline = Deadline()
+
+        # Get an iterator to the sorted products by popularity
+        # for each shop specified, skipping shops without products.
+        # Stop early if the deadline expires,
+        # but only once a shop with products is found.
+        iterators = []
+        for id in shop_ids:
+            if iterators and deadline.expired():
+                break
+            offsets = self._offsets.get(id)
+            if offsets is not None:
+                # At most `count` products of a single shop can be returned.
+                start, end = offsets
+                iterators.append((id, iter(self._products[start:min(end, start + count)])))
         
         # Create a composite iterator,
         # out of the products iterators
         # for the specified shops.
-        it = PopularProductsIterator(zip(shop_ids, iterators), count)
+        it = PopularProductsIterator(iterators, count, deadline)
 
         # List the most popular products.
         return list(it)
-    
-    @staticmethod
-    def _duplicate_reverse_order_comparer(x, y):
-        """ A reverse order comparer that allows duplicate entries.
-        If two items are equal it declares the first one greater.
-        
-        """
-        x = cmp(x, y)
-        if x == 0:
-            return 1
-        return -x
 
 
 class PopularProductsIterator(object):
     
-    def __init__(self, shops, count):
+    def __init__(self, shops, count, deadline=None):
         """ Iterates products by popularity from multiple shops.
         
         Parameters
@@ -101,6 +98,9 @@ class PopularProductsIterator(object):
             second item is an iterator to its products, ordered by Product.popularity.
         count : int
             The max number of products to return.
+        deadline : Deadline
+            The latency budget of the merge.
+            If it expires, the iteration stops early.
             
         """
         # Mappings from the shop's id to an iterator to its products.
@@ -111,6 +111,12 @@ class PopularProductsIterator(object):
         
         # The number of products left to return.
         self._count = count
+
+        # The number of products returned so far.
+        self._returned = 0
+
+        # The latency budget of the merge.
+        self._deadline = deadline if deadline is not None else Deadline()
         
         # Initialize the current most popular product per shop.
         for shop_id in self._shops.keys():
@@ -147,6 +153,14 @@ class PopularProductsIterator(object):
         # signal stop iteration.
         if self._count == 0 or not bool(self._most_popular_in_shop):
             raise StopIteration
+
+        # If the deadline is expired,
+        # the products returned so far are the most popular ones,
+        # so stop with a partial result.
+        # The most popular product is always returned,
+        # even if an earlier stage used up the whole budget.
+        if self._returned > 0 and self._deadline.expired():
+            raise StopIteration
         
         # Find the most popular product within the shops.
         p = max(self._most_popular_in_shop.values(), key=lambda p: p.popularity)
@@ -157,6 +171,7 @@ class PopularProductsIterator(object):
         
         # Decrease the remaining products to return.
         self._count -= 1
+        self._returned += 1
         return p
     
 
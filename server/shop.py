@@ -1,9 +1,15 @@
+import numpy as np
 from scipy.spatial import KDTree
 from geopy.distance import distance as geo_dist
-from math import cos, radians
+from math import cos, radians, sqrt
+from server.deadline import Deadline
 
 
 class ShopRepository(object):
+
+    # The number of candidates tested against a polygon
+    # between checks of the deadline.
+    _polygon_chunk = 4096
         
     def __init__(self, shops, taggings = None):
         """ Allows range searching for shops within a certain distance.
@@ -26,8 +32,8 @@ class ShopRepository(object):
         # makes it possible to perform range searching
         self._loc_index = KDTree(self._loc_data)
         
-        # mappings from a location to a shop
-        self._loc_to_shop = {s.location: s for s in shops}
+        # The shops, in the same order as their locations.
+        self._shops = list(shops)
         
         # mappings from a tag to shops that are tagged
         self._tag_to_shops = {}
@@ -52,7 +58,7 @@ class ShopRepository(object):
             self._tag_to_shops[tag] = set()
         return self._tag_to_shops[tag]
     
-    def find_shops(self, location, distance, tags=None):
+    def find_shops(self, location, distance, tags=None, deadline=None):
         """ Finds all shops within `distance` of the specified `location`.
         
         Parameters
@@ -64,6 +70,9 @@ class ShopRepository(object):
         tags : list of strings
             An list of tags that is used to filter the shops result.
             If a shop has none of the tags, it is filtered.
+        deadline : Deadline
+            The latency budget of the search.
+            If it expires, only the nearest shops found so far are returned.
         
         Returns
         -------
@@ -71,12 +80,127 @@ class ShopRepository(object):
             The list of Shops within range [ and filtered by tags].
         
         """
-        # Finds the locations of the shops.
-        locations = self._find_shop_locations(location, distance)
+        if deadline is None:
+            deadline = Deadline()
+
+        # Finds the indices of the shops.
+        loc_idx = self._find_shop_indices(location, distance, deadline)
         
-        # Get the shops by location.
-        shops = [self._loc_to_shop[loc] for loc in locations]
+        # Get the shops by index.
+        shops = [self._shops[i] for i in loc_idx]
         
+        return self._filter_by_tags(shops, tags)
+
+    def find_shops_in_polygon(self, polygon, tags=None, deadline=None):
+        """ Finds all shops within the specified `polygon`.
+
+        Parameters
+        ----------
+        polygon : list of tuples of floats of len 2
+            The GPS locations of the polygon's vertices, in order.
+        tags : list of strings
+            An list of tags that is used to filter the shops result.
+            If a shop has none of the tags, it is filtered.
+        deadline : Deadline
+            The latency budget of the search.
+            If it expires, only the candidates tested so far are returned.
+
+        Returns
+        -------
+        shops : list of Shops
+            The list of Shops within the polygon [ and filtered by tags].
+
+        """
+        if deadline is None:
+            deadline = Deadline()
+
+        vertices = np.asarray(polygon, dtype=float)
+
+        # Prune the candidates to the circle around the polygon's bounding box.
+        low, high = vertices.min(axis=0), vertices.max(axis=0)
+        radius = sqrt(((high - low) ** 2).sum()) / 2
+        loc_idx = self._loc_index.query_ball_point((low + high) / 2, radius)
+        loc_idx = np.asarray(sorted(loc_idx), dtype=int)
+
+        # Test the candidates against the polygon in chunks,
+        # each chunk at once.
+        # Stop early if the deadline expires,
+        # but only once the first chunk is tested.
+        found = []
+        for start in range(0, len(loc_idx), self._polygon_chunk):
+            if start > 0 and deadline.expired():
+                break
+            chunk = loc_idx[start:start + self._polygon_chunk]
+            inside = self._points_in_polygon(self._loc_index.data[chunk], vertices)
+            found.extend(chunk[inside])
+
+        shops = [self._shops[i] for i in found]
+        return self._filter_by_tags(shops, tags)
+
+    def find_shops_along_route(self, route, distance, tags=None, deadline=None):
+        """ Finds all shops within `distance` of the specified `route`.
+
+        Parameters
+        ----------
+        route : list of tuples of floats of len 2
+            The GPS locations of the route's points, in order.
+        distance : float
+            The limiting distance (in kilometers) from the route.
+        tags : list of strings
+            An list of tags that is used to filter the shops result.
+            If a shop has none of the tags, it is filtered.
+        deadline : Deadline
+            The latency budget of the search.
+            If it expires, only the shops along the start of the route are returned.
+
+        Returns
+        -------
+        shops : list of Shops
+            The list of Shops along the route [ and filtered by tags].
+
+        """
+        if deadline is None:
+            deadline = Deadline()
+
+        points = np.asarray(route, dtype=float)
+
+        # A route of a single point is a circle around it.
+        if len(points) < 2:
+            return self.find_shops(tuple(points[0]), distance, tags, deadline)
+
+        segments = zip(points[:-1], points[1:])
+
+        # Prune the candidates to the union of the circles
+        # around each segment, enlarged by `distance`.
+        # The segments are taken in order, so if the deadline expires
+        # the shops found so far are the ones along the start of the route.
+        candidates = set()
+        searched = []
+        for a, b in segments:
+            if searched and deadline.expired():
+                break
+
+            # Convert distance to longitude degrees at the segment's
+            # highest latitude, which is where a degree is the shortest.
+            lat = max(abs(a[0]), abs(b[0]))
+            degrees = distance / (111.111 * cos(radians(lat))) * 1.01
+            radius = sqrt(((b - a) ** 2).sum()) / 2 + degrees
+
+            candidates.update(self._loc_index.query_ball_point((a + b) / 2, radius))
+            searched.append((a, b))
+
+        # Test all candidates against the searched segments at once.
+        loc_idx = np.asarray(sorted(candidates), dtype=int)
+        distances = self._distance_to_segments(self._loc_index.data[loc_idx], searched)
+
+        shops = [self._shops[i] for i in loc_idx[distances <= distance]]
+        return self._filter_by_tags(shops, tags)
+
+    def _filter_by_tags(self, shops, tags):
+        """ Filters the shops that have none of the specified `tags`.
+        If no tags are specified, no shops are filtered.
+
+        """
         # If no tags specified, return the result.
         if tags is None:
             return shops
@@ -88,7 +212,7 @@ class ShopRepository(object):
         # If a shop has none of the specified tags - filter it.
         return filter(lambda shop: self._has_shop_any_tag(shop.id, tags_to_shops), shops)
     
-    def _find_shop_locations(self, location, distance):
+    def _find_shop_indices(self, location, distance, deadline):
         """ Perform the actual range search.            
             
         Parameters
@@ -97,6 +221,44 @@ class ShopRepository(object):
             The center GPS location used for the search.
         distance : float
             Limiting distance in km.
+        deadline : Deadline
+            The latency budget of the search.
+
+        Returns
+        -------
+        loc_idx : list of ints
+            The indices of the shops within range, in ascending order.
+
+        """
+        # Perform the actual range search
+        loc_idx = self._loc_index.query_ball_point(location, self._to_degrees(location, distance))
+
+        # Order the candidates nearest first,
+        # so that if the deadline expires
+        # the shops found so far are the closest ones.
+        lon_scale = cos(radians(location[0]))
+        loc_idx.sort(key=lambda i: (self._loc_data[i][0] - location[0]) ** 2 +
+                                   ((self._loc_data[i][1] - location[1]) * lon_scale) ** 2)
+
+        # Filter the result set, because of the enlarged distance,
+        # accounting for the distance deviation.
+        # Stop early if the deadline expires,
+        # but only once the nearest shop is found.
+        result = []
+        for i in loc_idx:
+            if result and deadline.expired():
+                break
+            if geo_dist(location, self._loc_data[i]) <= distance:
+                result.append(i)
+
+        # Restore the index order, so the shops are looked up
+        # in the order they are stored.
+        return sorted(result)
+
+    @staticmethod
+    def _to_degrees(location, distance):
+        """ Converts a distance in km to the radius in degrees
+        of a range search around `location`.
 
         """
         # Convert distance to longitude degrees at `location` latitude.
@@ -112,15 +274,74 @@ class ShopRepository(object):
         # Account for calculated distance deviation,
         # between geopy.distance.distance and
         # equating a flat 111.111 km per degree ratio.
-        degrees *= 1.01
+        return degrees * 1.01
 
-        # Perform the actual range search
-        loc_idx = self._loc_index.query_ball_point(location, degrees)
-        locations = [self._loc_data[i] for i in loc_idx]
-        
-        # Filter the result set, because of the enlarged distance,
-        # accounting for the distance deviation.
-        return filter(lambda l: geo_dist(location, l) <= distance, locations)
+    @staticmethod
+    def _points_in_polygon(points, vertices):
+        """ Checks which points lie within a polygon, using ray casting.
+
+        Parameters
+        ----------
+        points : array of shape (n, 2)
+            The GPS locations to check.
+        vertices : array of shape (m, 2)
+            The GPS locations of the polygon's vertices, in order.
+
+        Returns
+        -------
+        inside : array of bools of shape (n,)
+            Whether each point lies within the polygon.
+
+        """
+        lat, lon = points[:, 0], points[:, 1]
+        inside = np.zeros(len(points), dtype=bool)
+
+        # Cast a ray from each point towards increasing longitude.
+        # A point is inside if the ray crosses the edges an odd number of times.
+        for (lat_a, lon_a), (lat_b, lon_b) in zip(vertices, np.roll(vertices, -1, axis=0)):
+            # An edge parallel to the ray is never crossed.
+            if lat_a == lat_b:
+                continue
+            crossing = lon_a + (lat - lat_a) * (lon_b - lon_a) / (lat_b - lat_a)
+            inside ^= ((lat_a > lat) != (lat_b > lat)) & (lon < crossing)
+
+        return inside
+
+    @staticmethod
+    def _distance_to_segments(points, segments):
+        """ Computes the distance from each point to the nearest segment.
+
+        Parameters
+        ----------
+        points : array of shape (n, 2)
+            The GPS locations to measure.
+        segments : list of tuples of len 2
+            The GPS locations of each segment's end points.
+
+        Returns
+        -------
+        distances : array of floats of shape (n,)
+            The distance (in kilometers) from each point to the nearest segment.
+
+        """
+        distances = np.full(len(points), np.inf)
+
+        for a, b in segments:
+            # Project the points onto a plane in kilometers,
+            # with the origin at the start of the segment.
+            # Longitude is scaled at the segment's mean latitude.
+            scale = np.array([111.111, 111.111 * cos(radians((a[0] + b[0]) / 2))])
+            p = (points - a) * scale
+            v = (b - a) * scale
+
+            # Find the nearest point on the segment to each point.
+            length = (v ** 2).sum()
+            t = (p * v).sum(axis=1) / length if length > 0 else np.zeros(len(p))
+            nearest = np.clip(t, 0, 1)[:, None] * v
+
+            distances = np.minimum(distances, np.sqrt(((p - nearest) ** 2).sum(axis=1)))
+
+        return distances
 
     @staticmethod
     def _has_shop_any_tag(shop_id, tags_to_shops):
@@ -150,3 +371,74 @@ class Shop(object):
         # Name of the shop.
         self.name = name
 
+
+def hilbert_index(location, order=16, bounds=((-90, -180), (90, 180))):
+    """ Computes the position of a GPS location along a Hilbert curve.
+    Locations that are close along the curve are close in space too.
+
+    Parameters
+    ----------
+    location : tuple of floats of len 2
+        The GPS location. Format: (latitude, longitude).
+    order : int
+        The number of bits per coordinate of the curve's grid.
+    bounds : tuple of 2 GPS locations
+        The south-west and north-east corners of the area covered by the grid.
+
+    Returns
+    -------
+    index : int
+        The distance along the curve.
+
+    """
+    n = 1 << order
+    (lat_low, lon_low), (lat_high, lon_high) = bounds
+
+    # Map the location to a cell of the n x n grid.
+    x = int((location[1] - lon_low) / float(lon_high - lon_low or 1) * (n - 1))
+    y = int((location[0] - lat_low) / float(lat_high - lat_low or 1) * (n - 1))
+
+    index = 0
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        index += s * s * ((3 * rx) ^ ry)
+
+        # Rotate the quadrant, so the curve is continuous.
+        if ry == 0:
+            if rx == 1:
+                x = n - 1 - x
+                y = n - 1 - y
+            x, y = y, x
+        s >>= 1
+
+    return index
+
+
+def spatial_order(shops):
+    """ Orders the shops along a Hilbert curve,
+    covering the bounding box of the shops' locations.
+    Indexing shops in this order gives nearby shops nearby indices,
+    so the indices found by a range search form a few contiguous runs.
+    Only the order of the indices changes, not where the shops are in memory.
+
+    Parameters
+    ----------
+    shops : list of Shops
+        The shops to order.
+
+    Returns
+    -------
+    shops : list of Shops
+        The shops, ordered by the Hilbert index of their location.
+
+    """
+    if not shops:
+        return []
+
+    lats = [shop.location[0] for shop in shops]
+    lons = [shop.location[1] for shop in shops]
+    bounds = ((min(lats), min(lons)), (max(lats), max(lons)))
+
+    return sorted(shops, key=lambda shop: hilbert_index(shop.location, bounds=bounds))
@@ -0,0 +1,70 @@
+import pytest
+from server.api import parse_deadline, parse_path
+
+
+def test_can_parse_path():
+    assert [(1.0, 2.0), (3.5, -4.0)] == parse_path('1,2;3.5,-4')
+
+
+@pytest.mark.parametrize('value', ['', '1,2;', '1,2;3', '1,2,3', 'a,b', 'nan,nan', 'inf,0',
+                                   '0,-inf', '91,0', '-91,0', '0,181', '0,-181'])
+def test_parse_path_rejects_malformed_locations(value):
+    with pytest.raises(ValueError):
+        parse_path(value)
+
+
+def test_parse_path_rejects_too_few_locations():
+    with pytest.raises(ValueError):
+        parse_path('1,2;3,4', 3)
+
+
+@pytest.mark.parametrize('query', ['polygon=1,2;3,4', 'polygon=1,2;3,4;5,6;', 'route=', 'route=1,2;3',
+                                   'polygon=nan,nan;1,2;3,4', 'polygon=inf,0;0,inf;-inf,-inf',
+                                   'route=59.3,18.0;nan,18.1'])
+def test_search_rejects_malformed_paths(get, query):
+    assert 400 == get('/search?' + query).status_code
+
+
+@pytest.mark.parametrize('query', ['polygon=1,2;3,4;5,6&route=1,2',
+                                   'polygon=1,2;3,4;5,6&lat=1',
+                                   'polygon=1,2;3,4;5,6&d=5',
+                                   'route=1,2&lat=1&lon=2'])
+def test_search_rejects_multiple_shapes(get, query):
+    assert 400 == get('/search?' + query).status_code
+
+
+def test_can_search_in_polygon(get):
+    resp = get('/search?polygon=59.3,18.0;59.4,18.0;59.4,18.1;59.3,18.1')
+    assert 200 == resp.status_code
+    assert all(59.3 <= p['shop']['lat'] <= 59.4 for p in resp.json['products'])
+
+
+def test_can_search_along_route(get):
+    resp = get('/search?route=59.30,18.00;59.30,18.10&d=0.5')
+    assert 200 == resp.status_code
+    assert resp.json['products']
+    assert all(59.29 <= p['shop']['lat'] <= 59.31 for p in resp.json['products'])
+
+
+def test_deadline_is_capped_by_server_deadline():
+    assert 50 == parse_deadline('50', 200)
+    assert 200 == parse_deadline('1e9', 200)
+
+
+def test_deadline_is_not_capped_without_server_deadline():
+    assert 1e9 == parse_deadline('1e9', 0)
+
+
+@pytest.mark.parametrize('value', ['', 'a', '0', '-5', 'nan', 'inf'])
+def test_parse_deadline_rejects_invalid_values(value):
+    with pytest.raises(ValueError):
+        parse_deadline(value, 200)
+
+
+@pytest.mark.parametrize('value', ['0', '-5', 'nan', 'inf', 'a'])
+def test_search_rejects_invalid_deadline(get, value):
+    assert 400 == get('/search?deadline=' + value).status_code
+
+
+def test_search_accepts_deadline_above_server_deadline(get):
+    assert 200 == get('/search?deadline=1e9').status_code
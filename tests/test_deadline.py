@@ -0,0 +1,40 @@
+from server.deadline import Deadline
+
+
+def test_deadline_without_timeout_never_expires():
+    sut = Deadline()
+    assert not sut.expired()
+    assert not sut.exceeded
+
+
+def test_deadline_expires_after_timeout():
+    now = [0]
+    sut = Deadline(1, lambda: now[0])
+    assert not sut.expired()
+    now[0] = 1
+    assert sut.expired()
+    assert sut.exceeded
+
+
+def test_expired_deadline_stays_expired():
+    now = [0]
+    sut = Deadline(1, lambda: now[0])
+    now[0] = 2
+    assert sut.expired()
+    now[0] = 0
+    assert sut.expired()
+
+
+def test_share_expires_before_deadline():
+    now = [0]
+    deadline = Deadline(10, lambda: now[0])
+    sut = deadline.share(0.5)
+    now[0] = 5
+    assert sut.expired()
+    assert not deadline.expired()
+    assert deadline.exceeded
+
+
+def test_share_of_deadline_without_timeout_never_expires():
+    sut = Deadline().share(0.5)
+    assert not sut.expired()
@@ -1,4 +1,5 @@
 from server.product import PopularProductsIterator
+from server.deadline import Deadline
 from tests.helpers import most_popular, flatten, gen_products
 
 
@@ -39,3 +40,23 @@ def test_iterator_can_handle_no_data():
     sut = PopularProductsIterator([], 10)
     assert len(list(sut)) == 0
 
+
+def test_iterator_stops_when_deadline_expires():
+    products = gen_products(1, 10)
+    sut = PopularProductsIterator([(1, iter(products))], 10, Deadline(0))
+    assert products[0:1] == list(sut)
+
+
+def test_iterator_returns_most_popular_before_deadline_expires():
+    shop_ids = range(10)
+    products = [gen_products(id) for id in shop_ids]
+    shops = zip(shop_ids, [iter(p) for p in products])
+    now = [0]
+    deadline = Deadline(5, lambda: now[0])
+    sut = PopularProductsIterator(shops, 10, deadline)
+
+    result = [sut.next() for i in range(5)]
+    now[0] = 5
+
+    assert most_popular(flatten(products), 5) == result + list(sut)
+    assert deadline.exceeded
@@ -1,5 +1,7 @@
+from server.deadline import Deadline
 from server.product import PopularProductsService
-from tests.helpers import gen_products, flatten, most_popular
+from server.shop import Shop, ShopRepository
+from tests.helpers import gen_products, flatten, most_popular, loc_in_range
 
 
 def test_can_find_most_popular_products():
@@ -43,3 +45,40 @@ def test_can_handle_no_data():
     sut = PopularProductsService([])
     assert [] == sut.find_popular_products(range(10), 100)
 
+
+def test_shop_order_does_not_change_result():
+    products = [gen_products(shop_id, 10) for shop_id in range(10)]
+    sut = PopularProductsService(flatten(products), [9, 3, 7, 1])
+
+    expected = most_popular(products[1] + products[3] + products[8], 10)
+    actual = sut.find_popular_products([8, 3, 1], 10)
+
+    assert expected == actual
+
+
+def test_partial_search_still_merges_products():
+    now = [0]
+    deadline = Deadline(10, lambda: now[0])
+    locations = [loc_in_range((0, 20), 10) for shop_id in range(10)]
+    shops = [Shop(shop_id, loc) for shop_id, loc in enumerate(locations)]
+    products = [gen_products(shop_id, 10) for shop_id in range(10)]
+    repo = ShopRepository(shops)
+    sut = PopularProductsService(flatten(products))
+
+    # The range search uses up its share of the budget.
+    range_deadline = deadline.share(0.5)
+    now[0] = 5
+    found = repo.find_shops((0, 20), 10, deadline=range_deadline)
+
+    result = sut.find_popular_products([s.id for s in found], 10, deadline)
+
+    assert len(found) < len(shops)
+    assert most_popular(flatten(products[s.id] for s in found), 10) == result
+    assert 10 == len(result)
+    assert deadline.exceeded
+
+
+def test_expired_deadline_skips_shops_without_products():
+    products = gen_products(1, 5)
+    sut = PopularProductsService(products)
+    assert products[0:1] == sut.find_popular_products([2, 1, 3], 5, Deadline(0))
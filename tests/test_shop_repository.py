@@ -1,6 +1,7 @@
 from numpy import median
 from geopy.distance import distance as geo_dist
-from server.shop import Shop, ShopRepository
+from server.deadline import Deadline
+from server.shop import Shop, ShopRepository, hilbert_index, spatial_order
 from tests.helpers import loc_in_range
 
 # Distance in km.
@@ -38,6 +39,120 @@ def test_can_filter_shops_by_tag():
     assert set(expected) == set(actual)
 
 
+def test_expired_deadline_returns_nearest_shop():
+    center_loc = (59, 18)
+    # Shops spaced far apart, in different directions from the center.
+    locations = [(59.3, 18), (59, 18.2), (58.5, 18), (59, 16.5), (60, 19)]
+    shops = [new_shop(loc) for loc in locations]
+    sut = ShopRepository(shops)
+    deadline = Deadline(0)
+
+    expected = min(shops, key=lambda shop: geo_dist(center_loc, shop.location))
+    actual = sut.find_shops(center_loc, max_distance, deadline=deadline)
+
+    assert [expected] == actual
+    assert deadline.exceeded
+
+
+def test_can_find_shops_in_polygon():
+    center_loc = (10, 20)
+    locations = [loc_in_range(center_loc, max_distance) for x in range(shop_count)]
+    shops = [new_shop(loc) for loc in locations]
+    sut = ShopRepository(shops)
+
+    # A triangle covering the north-east of the center.
+    polygon = [(10, 20), (11, 20), (10, 21)]
+
+    expected = [shop for shop in shops
+                if shop.location[0] > 10 and shop.location[1] > 20
+                and (shop.location[0] - 10) + (shop.location[1] - 20) < 1]
+    actual = sut.find_shops_in_polygon(polygon)
+
+    assert set(expected) == set(actual)
+
+
+def test_can_find_no_shops_in_polygon():
+    sut = ShopRepository([new_shop((0, 0)), new_shop((1, 1))])
+    assert [] == sut.find_shops_in_polygon([(10, 10), (11, 10), (10, 11)])
+
+
+def test_expired_deadline_returns_first_polygon_chunk():
+    center_loc = (10, 20)
+    locations = [loc_in_range(center_loc, max_distance) for x in range(shop_count)]
+    shops = [new_shop(loc) for loc in locations]
+    sut = ShopRepository(shops)
+    sut._polygon_chunk = 50
+    deadline = Deadline(0)
+
+    polygon = [(9, 19), (11, 19), (11, 21), (9, 21)]
+    actual = sut.find_shops_in_polygon(polygon, deadline=deadline)
+
+    assert 50 == len(actual)
+    assert set(actual) < set(shops)
+    assert deadline.exceeded
+
+
+def test_can_find_shops_along_route():
+    distance = 10
+    route = [(0, 20), (0, 20.5), (0.5, 20.5)]
+    locations = [loc_in_range((0.25, 20.25), max_distance) for x in range(shop_count)]
+    shops = [new_shop(loc) for loc in locations]
+    sut = ShopRepository(shops)
+
+    actual = set(sut.find_shops_along_route(route, distance))
+
+    # The route distance is approximated,
+    # so only check shops clearly within or beyond it.
+    for shop in shops:
+        d = dist_to_route(route, shop.location)
+        if d < distance * 0.98:
+            assert shop in actual
+        elif d > distance * 1.02:
+            assert shop not in actual
+
+
+def test_hilbert_index_visits_neighbouring_cells():
+    order = 3
+    n = 1 << order
+    cells = [(y, x) for x in range(n) for y in range(n)]
+    location = lambda c: (c[0] * 180.0 / (n - 1) - 90, c[1] * 360.0 / (n - 1) - 180)
+
+    path = sorted(cells, key=lambda c: hilbert_index(location(c), order))
+
+    assert range(n * n) == sorted(hilbert_index(location(c), order) for c in cells)
+    assert all(abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1 for a, b in zip(path, path[1:]))
+
+
+def test_hilbert_index_uses_resolution_within_bounds():
+    a, b = (59.3301, 18.0601), (59.3302, 18.0601)
+    bounds = ((59.33, 18.06), (59.331, 18.061))
+
+    assert hilbert_index(a) == hilbert_index(b)
+    assert hilbert_index(a, bounds=bounds) != hilbert_index(b, bounds=bounds)
+
+
+def test_spatial_order_keeps_all_shops():
+    locations = [loc_in_range((0, 20), max_distance) for x in range(shop_count)]
+    shops = [new_shop(loc) for loc in locations]
+    sut = ShopRepository(spatial_order(shops))
+
+    expected = [shop for shop in shops if geo_dist((0, 20), shop.location) <= 50]
+    actual = sut.find_shops((0, 20), 50)
+
+    assert set(expected) == set(actual)
+
+
+def dist_to_route(route, loc):
+    """ Computes the distance from `loc` to a route
+    of one east and one north heading segment.
+
+    """
+    (lat_a, lon_a), (lat_b, lon_b), (lat_c, lon_c) = route
+    lat, lon = loc
+    return min(geo_dist(loc, (lat_a, min(max(lon, lon_a), lon_b))).kilometers,
+               geo_dist(loc, (min(max(lat, lat_b), lat_c), lon_b)).kilometers)
+
+
 def new_shop(loc):
     return Shop(get_id(loc), loc)
 